@@ -1,17 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os, sys, shlex, shutil
-import subprocess
+import os, shutil
+import re
+import platform
 from pathlib import Path
 
 
 COLUMNS = 88
 
-env = os.environ.copy()
-env["COLUMNS"] = str(COLUMNS)
+# argparse reads this when formatting so it must be set before any help is built
+os.environ["COLUMNS"] = str(COLUMNS)
 
-os.chdir(os.path.dirname(__file__))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import dfb
+from dfb.cli import build_parser
 
 commands = """\
 init
@@ -38,41 +42,44 @@ utils rpath2apath
 commands = [l.strip() for l in commands.split("\n") if l.strip()]
 commands.insert(0, None)
 
+# Collected as encoded bytes so they can be written directly
 helpmd = [
-    "# CLI Help",
+    b"# CLI Help",
 ]
 
-ver = (
-    subprocess.check_output([sys.executable, "dfb.py", "version"], env=env)
-    .strip()
-    .decode()
-)
-pyver = subprocess.check_output([sys.executable, "--version"], env=env).strip().decode()
+ver = f"dfb-{dfb.__version__}"
+if dfb.__git_version__:
+    ver += f"|{dfb.__git_version__['version']}"
+pyver = f"Python {platform.python_version()}"
 helpmd.append(
     f"""
 version: `{ver}`  
-"""
+""".encode()
 )
 
+# Render everything in-process from a single parser rather than calling out to
+# dfb.py for each command
+parser = build_parser()
+
+
 for command in commands:
     command = command or ""  # sill Falsy but can be used later to extend
     name = command or "No Command"
-    helpmd.append(f"# {name}")
-
-    cmd = [sys.executable, "dfb.py", *shlex.split(command), "--help"]
+    helpmd.append(f"# {name}".encode())
 
-    help = subprocess.check_output(cmd, env=env)
-    help = help.decode().replace("usage: dfb.py", "usage: dfb")
+    cmdparser = parser.commands[command] if command else parser
+    help = cmdparser.format_help()
 
     helpmd.append(
         f"""
 ```text
 {help}
-```"""
+```""".encode()
     )
 
-with open("docs/CLI_help.md", "wt") as f:
-    f.write("\n\n".join(helpmd))
+with open("docs/CLI_help.md", "wb", buffering=1 << 20) as f:
+    f.writelines(chunk + b"\n\n" for chunk in helpmd[:-1])
+    f.write(helpmd[-1])
 
 # Build the readme for docs
 docs = Path("docs")
@@ -87,33 +94,35 @@ for file in sorted(docs.glob("*.md"), key=lambda p: p.name.lower()):
     if file.name == "readme.md":
         continue
 
-    for line in file.read_text().splitlines():
-        if not line.strip():
-            continue
-        title = line.strip().lstrip("#").strip()
-        break
-    else:
+    # Only read up to the first non-blank line
+    with file.open("r", encoding="utf-8") as fh:
+        title = next((l.strip().lstrip("#").strip() for l in fh if l.strip()), None)
+    if title is None:
         continue  # empty file
 
     md.append(f"- [{title}]({file.name})")
     md2.append(f"- [{title}](docs/{file.name})")
 
-(docs / "readme.md").write_text("\n".join(md))
+with open(docs / "readme.md", "wb") as f:
+    f.write("\n".join(md).encode())
 
-with open("readme.md", "r") as rmin, open(".readme.md.swp", "wt") as rmout:
-    for line in rmin:
-        rmout.write(line)
-
-        if not line.startswith("<!--- BEGIN AUTO GENERATED -->"):
-            continue
-
-        rmout.write("\n".join(md2))  # write md2
-
-        for line in rmin:  # keep reading until we get our line
-            if not line.startswith("<!--- END AUTO GENERATED -->"):
-                continue
-            rmout.write("\n<!--- END AUTO GENERATED -->\n")
-            break
-        else:
-            raise ValueError("Did not find end sentinel")
+# Splice md2 between the sentinels in one pass over the whole file
+BEGIN, END = "<!--- BEGIN AUTO GENERATED -->", "<!--- END AUTO GENERATED -->"
+readme = Path("readme.md").read_text(encoding="utf-8")
+if match := re.search(rf"^{BEGIN}[^\n]*\n", readme, flags=re.MULTILINE):
+    end = re.compile(rf"^{END}[^\n]*\n?", flags=re.MULTILINE).search(
+        readme, match.end()
+    )
+    if not end:
+        raise ValueError("Did not find end sentinel")
+    readme = "".join(
+        [
+            readme[: match.end()],
+            "\n".join(md2),
+            f"\n{END}\n",
+            readme[end.end() :],
+        ]
+    )
+with open(".readme.md.swp", "wb") as f:
+    f.write(readme.encode())
 shutil.move(".readme.md.swp", "readme.md")
@@ -20,36 +20,58 @@ _override_ts = os.environ.get("DFB_OVERRIDE_TIMESTAMP", None)
 _override_unix = os.environ.get("DFB_OVERRIDE_UNIXTIME", None)
 _override_offset = 0
 
+# Bound once so nowfun doesn't have to resolve the dotted names on every call
+_now = datetime.datetime.now
+_fromtimestamp = datetime.datetime.fromtimestamp
+_utc = datetime.timezone.utc
+_timedelta = datetime.timedelta
+
 
 def nowfun():
     """
     Return current datetime.
     This is its own function so _override_unix and _override_offset can
-    be set in tests
+    be set in tests. Call _refresh_nowfun() after changing them
     """
+    if not _overridden:
+        return time2all(_now())
+    return _nowfun_overridden()
+
+
+def _nowfun_overridden():
     if _override_ts:
-        now = timestamp_parser(_override_ts)
+        now = _override_ts_dt
     elif _override_unix:
-        now = datetime.datetime.fromtimestamp(_override_unix, datetime.timezone.utc)
+        now = _fromtimestamp(_override_unix, _utc)
     else:
-        now = datetime.datetime.now()
+        now = _now()
 
     if _override_offset:
-        now += datetime.timedelta(seconds=_override_offset)
+        now += _timedelta(seconds=_override_offset)
 
     return time2all(now)
 
 
-def nowfun_obj():
-    return nowfun().obj
+def _refresh_nowfun():
+    """
+    The overrides are constant outside of testing so only check them when they are
+    set rather than on every nowfun() call
+    """
+    global _overridden, _override_ts_dt
+    _overridden = bool(_override_ts or _override_unix or _override_offset)
+
+    # Parse once here rather than every call. Relative overrides are from the real time
+    _override_ts_dt = (
+        timestamp_parser(_override_ts, now=_now()) if _override_ts else None
+    )
+
 
+_refresh_nowfun()
 
-# Monkey patch this into timestamps. We do this so that timestamps *can* exists 100%
-# without dfb (such as if I ever want to copy/paste the code) but for dfb, we want this
-# version of nowfun since it can be overridden for testing
-from . import timestamps
 
-timestamps.nowfun = nowfun
+def nowfun_obj():
+    return nowfun().obj
+
 
 # For testing only. I can add fail points
 _FAIL = set()
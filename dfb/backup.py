@@ -11,14 +11,15 @@ import subprocess
 import shlex
 import atexit
 import shutil
-import queue
 import logging
 import math
+import hashlib
 import gzip as gz
-from collections import defaultdict
+from collections import defaultdict, deque
 from textwrap import dedent
-from threading import Thread
+from threading import Thread, Event
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, as_completed
 
 from . import LOCK, MIN_RCLONE
 from .dstdb import DFBDST, apath2rpath
@@ -39,6 +40,80 @@ from . import _FAIL
 logger = logging.getLogger(__name__)
 
 DFB_EMPTY = ".dfbempty"
+_DFB_EMPTY_SUBPATH = f"/{DFB_EMPTY}"
+
+
+# Same text as json.dumps({"ver": 2, "rel": rel}) with only rel encoded per file
+_REF_TEMPLATE = '{{"ver": 2, "rel": {}}}'
+
+# run_stats SQL. Both the current and the total stats come out of one pass over items.
+# The per-apath group carries the totals for all of its versions and the outer select
+# (without the usual size >= 0 filter) sums those and the current ones
+_STATS_SUMSIZE = """SUM(CASE 
+        WHEN (size >= 0 AND (isref IS NULL OR isref = 0) )
+        THEN size ELSE 0 END)"""
+_STATS_GROUPSELECT = f"*, {_STATS_SUMSIZE} AS grp_totsize, COUNT(size) AS grp_num"
+_STATS_SELECT = f"""
+    {_STATS_SUMSIZE} AS totsize,
+    COUNT(CASE WHEN size >= 0 THEN 1 END) AS num,
+    SUM(grp_totsize) AS all_totsize,
+    COALESCE(SUM(grp_num), 0) AS all_num
+    """
+
+
+def _is_empty_marker(apath):
+    # Same as os.path.basename(apath) == DFB_EMPTY without splitting the path
+    return apath.endswith(_DFB_EMPTY_SUBPATH) or apath == DFB_EMPTY
+
+
+def _local_hash(path, htype, *, bufsize=256 * 1024):
+    """
+    Hash a local file. Uses hashlib.file_digest where available (3.11+) which does the
+    reading and hashing in C, releasing the GIL
+    """
+    with open(path, "rb", buffering=0) as fp:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(fp, htype).hexdigest()
+
+        hasher = hashlib.new(htype)
+        while chunk := fp.read(bufsize):
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+
+def _sizes_only(sfile, dfile):
+    # Sizes are compared before this is called
+    if logger.isEnabledFor(logging.DEBUG):  # Don't build the message otherwise
+        logger.debug(f"Compare {sfile['apath']!r} with attrib = 'size'. MATCH")
+    return True
+
+
+def _mtime_match(sfile, dfile, *, dt):
+    try:
+        match = abs(sfile["mtime"] - dfile["mtime"]) < dt
+    except (KeyError, TypeError):
+        match = False
+
+    if logger.isEnabledFor(logging.DEBUG):  # Don't build the message otherwise
+        if match:
+            why = "MATCH"
+        else:
+            s = sfile.get("mtime", "src_missing_mtime")
+            d = dfile.get("mtime", "dst_missing_mtime")
+            why = f"Mismatch mtime. src: {s}, dst: {d}."
+        logger.debug(f"Compare {sfile['apath']!r} with attrib = 'mtime'. {why}")
+    return match
+
+
+def _mtime_bucket(file, width):
+    """
+    Bucket of width seconds for the file's mtime or None if it has no usable mtime.
+    Two mtimes less than width/2 apart always land in the same or adjacent buckets
+    """
+    try:
+        return math.floor(file["mtime"] / width)
+    except (KeyError, TypeError, ValueError, OverflowError, ZeroDivisionError):
+        return None
 
 
 class NoCommonHashError(ValueError):
@@ -77,11 +152,9 @@ class Backup:
 
         self.dstdb = DFBDST(config)
 
-        # Step 1: List Files locally and maybe on remote
-        self.list_files()  # self.src_files, self.dst_files
-
-        # Step 2: Compare
-        self.compare()  # sets new, modified, deleted, and update_dstdb
+        # Step 1 & 2: List Files locally and maybe on remote then compare. The compare
+        # may happen as the source is listed
+        self.list_files()  # self.src_files, self.dst_files, new, modified, deleted...
 
         # update dstdb for files that match on dst_compare so that they can
         # use [src]compare next time.
@@ -110,12 +183,13 @@ class Backup:
         if file := cliconfig.dump:
             try:
                 fp = smart_open(file, "wt") if file != "-" else sys.stdout
-                for item in self.dump:
-                    print(
-                        json.dumps(item, ensure_ascii=False, separators=(",", ":")),
-                        file=fp,
-                        flush=True,
-                    )
+                # json.dumps with non-default options builds a new encoder for every
+                # call so make one and let the stream buffer instead of flushing each
+                encode = json.JSONEncoder(
+                    ensure_ascii=False, separators=(",", ":")
+                ).encode
+                fp.writelines(f"{encode(item)}\n" for item in self.dump)
+                fp.flush()
             finally:
                 if file != "-":
                     fp.close()
@@ -137,29 +211,58 @@ class Backup:
             self.upload_logs()
 
     def list_files(self, stats=None):
-        """List the source and refresh dest if needed"""
+        """
+        List the source and refresh dest if needed. Also compares them (sets new,
+        modified, deleted, and update_dstdb).
+
+        When the dest doesn't need a refresh, it is already known so the source
+        is compared as it is listed rather than after
+        """
         config = self.config
         kwargs = dict(stats=stats or self.config.stats)
 
         if self.config.cliconfig.refresh:
-            sthread = ReturnThread(target=self.list_src, kwargs=kwargs).start()
+            # The source dict is built on the listing thread so it is ready as soon as
+            # the reset is done rather than built from a list afterwards
+            def _list_src(**kw):
+                src_files = {}
+                for file in self.list_src_iter(**kw):
+                    src_files.setdefault(file["apath"], file)  # First wins. See below
+                return src_files
+
+            sthread = ReturnThread(target=_list_src, kwargs=kwargs).start()
             dthread = ReturnThread(
                 target=self.dstdb.reset,
                 kwargs=kwargs | {"use_snapshots": config.cliconfig.use_snapshots},
             ).start()
-            source_files = sthread.join()
             dthread.join()
+            self._proc_dst_files()  # Can overlap the rest of the source listing
 
-            self._proc_dst_files()
+            self.src_files = sthread.join()
+            self.compare()
         else:
             # when we don't have to refresh, do this before listing the source just
             # so the user has some idea of how many files to possibly expect
             self._proc_dst_files()
 
             logger.info("Listing source")
-            source_files = self.list_src(**kwargs)
-
-        self.src_files = {file["apath"]: file for file in source_files}
+            self.src_files = src_files = {}
+            self._compare_start()
+            files = self.list_src_iter(**kwargs)
+            try:
+                for file in files:
+                    # Some remotes (e.g. Drive) can list the same path twice. Only the
+                    # first is used (on both paths) since it has already been compared
+                    if (apath := file["apath"]) in src_files:
+                        logger.debug(f"Duplicate source path {apath!r}. Skipping")
+                        continue
+                    src_files[apath] = file
+                    self._compare_file(apath, file)
+            finally:
+                # Stops the listing (rclone and any hashing) right away if the compare
+                # failed. No-op when it is done
+                files.close()
+            self._compare_finish()
 
         logger.info(f"Found {len(self.src_files)} source Files")
 
@@ -169,7 +272,11 @@ class Backup:
         self.dst_files = {file["apath"]: file for file in d}
         logger.info(f"Backup contains {len(self.dst_files)} current files")
 
-    def list_src(self, stats=None):
+    def list_src_iter(self, stats=None):
+        """
+        Yield the source files as they are listed. Empty directory markers, if
+        used, come at the end since they require the full listing.
+        """
         config = self.config
 
         fsroot = config.rc.features(config.src).get("Root", "")
@@ -202,6 +309,10 @@ class Backup:
             msg = f"subdir {subdir!r} specified. Filters may break!"
             logger.warning(msg)
 
+        # Always list with rclone, even when the source is local (fsroot). A direct
+        # walk (scandir, io_uring, etc) would have to reimplement rclone's filtering,
+        # symlink handling (--links, --copy-links), --one-file-system and metadata
+        # and would silently diverge from what gets transferred.
         rcfiles = config.src_rclone.listremote(
             filter_flags=config.filter_flags,
             # fast_list=... # Would be in rclone_flags. Already set
@@ -214,53 +325,81 @@ class Backup:
             subdir=subdir,
         )
 
-        files = []
         dirs = set()
         parents = set()
 
-        t0 = time.time()
-        c = 0
+        def _iter_files():
+            # Bound once for the per-file loop
+            join, dirname, now = os.path.join, os.path.dirname, time.time
+            add_dir, add_parent = dirs.add, parents.add
+            ignored = IGNORED_FILE_DATA
+            keep_hashes = "no_rclone_hashes" not in _FAIL  # Testing
 
-        for item in rcfiles:
-            if item["IsDir"]:
-                dirs.add(os.path.join(subdir, item["Path"]))
+            t0 = now()
+            c = 0
 
-                # could be nested w/o files so add the parent just in case
-                pdir = os.path.join(subdir, os.path.dirname(item["Path"]))
-                parents.add(pdir.removesuffix("/"))
+            for item in rcfiles:
+                if item["IsDir"]:
+                    add_dir(join(subdir, item["Path"]))
 
-                continue
-            else:
-                file = item
+                    # could be nested w/o files so add the parent just in case
+                    pdir = join(subdir, dirname(item["Path"]))
+                    add_parent(pdir.removesuffix("/"))
 
-            c += 1
-            new = {
-                "apath": os.path.join(subdir, file.pop("Path")),
-                "size": file.pop("Size"),
-                "mtime": file.pop("ModTime", None),
-            }
+                    continue
+                else:
+                    file = item
 
-            if hashes := file.pop("Hashes", None):
-                new["checksum"] = hashes
+                c += 1
+                new = {
+                    "apath": join(subdir, file.pop("Path")),
+                    "size": file.pop("Size"),
+                    "mtime": file.pop("ModTime", None),
+                }
 
-            for k, v in file.items():
-                if k in IGNORED_FILE_DATA:
-                    continue
-                new[k] = v
+                if (hashes := file.pop("Hashes", None)) and keep_hashes:
+                    new["checksum"] = hashes
+
+                for k, v in file.items():
+                    if k in ignored:
+                        continue
+                    new[k] = v
+
+                add_parent(dirname(new["apath"]))
+
+                if stats and (now() - t0) >= stats:  # TODO TEST
+                    logger.info(f"Source Listing Status: {c} items")
+                    t0 = now()
 
-            files.append(new)
-            parents.add(os.path.dirname(new["apath"]))
+                yield new
 
-            if stats and (time.time() - t0) >= stats:  # TODO TEST
-                logger.info(f"Source Listing Status: {c} items")
-                t0 = time.time()
+        listed = files = _iter_files()
+
+        # If the source is local and rclone didn't give the hashes, compute them here
+        # rather than falling back to size later
+        if compute_hashes and fsroot:
+            files = self._local_hashes(files, fsroot)
 
         # Testing
-        if "missing_hashes" in _FAIL:
-            for file in files:
-                file.pop("checksum", None)
+        drop_hashes = "missing_hashes" in _FAIL
         # end testing
 
+        c = 0
+        try:
+            for file in files:
+                if drop_hashes:  # Testing
+                    file.pop("checksum", None)
+
+                c += 1
+                yield file
+        finally:
+            # When closed early (e.g. the compare failed), shut down each stage now
+            # rather than whenever they are garbage collected. Closing rcfiles stops
+            # rclone. No-op if they are already done
+            files.close()
+            listed.close()
+            rcfiles.close()
+
         empty = dirs - parents
         if config.empty_directory_markers:
             for edir in empty:
@@ -269,110 +408,226 @@ class Backup:
                     "mtime": -12345,
                     "size": 0,
                 }
-                files.append(new)
+                c += 1
+                yield new
 
-        logger.debug(f"Listed {len(files)} files")
-        return files
+        logger.debug(f"Listed {c} files")
 
-    def compare(self):
+    def _local_hashes(self, files, fsroot):
+        """
+        Compute missing hashes on a local source concurrently. Yields all files (in
+        any order).
+
+        The listing is read here, on the calling thread. Only the files that need
+        hashing are sent to a worker pool, which isn't started until one does. The
+        rest are yielded as they come. Closing this stops the pool.
+        """
         config = self.config
 
+        htypes = listify(config.hash_type) or ["md5", "sha1"]
+        htypes = [htype for htype in htypes if htype in hashlib.algorithms_available]
+        if not htypes:
+            yield from files
+            return
+
+        # Small files only need hashes for rename tracking. Skip them unless hashes
+        # are also used for the comparison
+        min_size = 0
+        if "hash" not in (config.compare, config.dst_compare):
+            min_size = config.min_rename_size or 0
+
+        def _hash(file):
+            path = os.path.join(fsroot, file["apath"])
+            logger.debug(f"Computing hashes locally for {file['apath']!r}")
+            try:
+                file["checksum"] = {htype: _local_hash(path, htype) for htype in htypes}
+            except OSError as EE:
+                logger.warning(f"Could not hash {path!r}. {EE}")
+            return file
+
+        Nt = config.concurrency
+        pool = None
+        pending = set()
+        try:
+            for file in files:
+                if (
+                    file.get("checksum")
+                    or file["size"] <= min_size
+                    or file["apath"].endswith(".rclonelink")
+                ):
+                    yield file
+                    continue
+
+                if pool is None:
+                    pool = ThreadPoolExecutor(max_workers=Nt)
+                pending.add(pool.submit(_hash, file))
+
+                # Yield what is done. Wait only when too many are queued so the
+                # listing isn't read too far ahead of the hashing
+                if len(pending) >= 2 * Nt:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                else:
+                    done = {future for future in pending if future.done()}
+                    pending -= done
+                for future in done:
+                    yield future.result()
+
+            for future in as_completed(pending):
+                yield future.result()
+        finally:
+            if pool is not None:
+                # Only matters when closed early (or on error). Don't start hashing
+                # anything else and don't wait on what is running
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def compare(self):
+        """Compare src_files and dst_files. Sets new, modified, deleted, update_dstdb"""
+        self._compare_start()
+
+        # Split on the key lookup here rather than the exception in _compare_file.
+        # Only the paths at both ends need the attribute comparison
+        new = self.new
+        dst_get = self.dst_files.get
+        compare_existing = self._compare_existing
+        for apath, sfile in self.src_files.items():
+            if (dfile := dst_get(apath)) is None:
+                new.append(apath)
+            else:
+                compare_existing(apath, sfile, dfile)
+
+        self._compare_finish()
+
+    def _compare_start(self):
         self.new = []
         self.modified = []
-        self.deleted = list(set(self.dst_files) - set(self.src_files))
+        self.deleted = []
         self.update_dstdb = []
 
-        for apath, sfile in self.src_files.items():
-            try:
-                dfile = self.dst_files[apath]
-            except KeyError:
-                self.new.append(apath)
-                continue
+        # Pick the attribute comparison once, indexed by dstinfo, rather than
+        # branching on the attribute inside file_compare for every file
+        self._attrib_compare = (
+            self._attrib_comparer(self.config.compare),
+            self._attrib_comparer(self.config.dst_compare),
+        )
 
-            if os.path.basename(apath) == DFB_EMPTY:
-                compare = True  # Always compare empties to true regardless of attribs
-            else:
-                compare = self.file_compare(sfile, dfile)
+    def _attrib_comparer(self, attrib):
+        """Comparison for files whose sizes are already known to match"""
+        if attrib == "size":
+            return _sizes_only
+        if attrib == "mtime":
+            return partial(_mtime_match, dt=self.config.dt)
+        return partial(self.file_compare, attrib=attrib)  # hash
 
-            if not compare:
-                self.modified.append(apath)
-                continue
+    def _compare_file(self, apath, sfile):
+        try:
+            dfile = self.dst_files[apath]
+        except KeyError:
+            self.new.append(apath)
+            return
+        self._compare_existing(apath, sfile, dfile)
+
+    def _compare_existing(self, apath, sfile, dfile):
+        if _is_empty_marker(apath):
+            compare = True  # Always compare empties to true regardless of attribs
+        elif sfile.get("size") != dfile.get("size"):
+            # Sizes must always match regardless of attrib. This is the most common
+            # change so decide it here without the full file_compare
+            logger.debug(
+                f"Compare {apath!r}. Mismatch sizes. "
+                f"src: {sfile.get('size', 'src_missing_size')}, "
+                f"dst: {dfile.get('size', 'dst_missing_size')}."
+            )
+            compare = False
+        else:
+            compare = self._attrib_compare[1 if dfile["dstinfo"] else 0](sfile, dfile)
 
-            # They match! But see if we need to update the dstdb with the better
-            # information at source. This enables things like using mtime for
-            # source-to-source but not for source-to-dest
-            if dfile["dstinfo"]:
-                logger.debug(f"Updating {apath!r} with src info")
-                new = dfile.copy()
-                new.update(sfile)
-                new["dstinfo"] = 0
-                self.update_dstdb.append(new)
+        if not compare:
+            self.modified.append(apath)
+            return
+
+        # They match! But see if we need to update the dstdb with the better
+        # information at source. This enables things like using mtime for
+        # source-to-source but not for source-to-dest
+        if dfile["dstinfo"]:
+            logger.debug(f"Updating {apath!r} with src info")
+            new = dfile.copy()
+            new.update(sfile)
+            new["dstinfo"] = 0
+            self.update_dstdb.append(new)
+
+    def _compare_finish(self):
+        # Needs the full source listing
+        self.deleted = list(self.dst_files.keys() - self.src_files.keys())
 
     def file_compare(self, sfile, dfile, attrib=None):
         config = self.config
 
-        attrib = attrib or (
-            config.dst_compare if dfile["dstinfo"] else self.config.compare
-        )
+        attrib = attrib or (config.dst_compare if dfile["dstinfo"] else config.compare)
 
-        msg = [f"Compare {sfile['apath']!r} with {attrib = }."]
-        try:
-            s = sfile.get("size", "src_missing_size")
-            d = dfile.get("size", "dst_missing_size")
-            if s != d:
-                msg.append(f"Mismatch sizes. src: {s}, dst: {d}.")
-                return False
+        match, why = self._file_compare(sfile, dfile, attrib)
+        if logger.isEnabledFor(logging.DEBUG):  # Don't build the message otherwise
+            logger.debug(f"Compare {sfile['apath']!r} with {attrib = }. {why}")
+        return match
 
-            if attrib == "mtime":
-                s = sfile.get("mtime", "src_missing_mtime")
-                d = dfile.get("mtime", "dst_missing_mtime")
-                try:
-                    c = abs(s - d) < config.dt
-                except TypeError:
-                    c = False
-                if not c:
-                    msg.append(f"Mismatch mtime. src: {s}, dst: {d}.")
-                    return False
-
-            if attrib == "hash":
-                scheck = sfile.get("checksum", {}) or {}  # Nones to empty dict
-                dcheck = dfile.get("checksum", {}) or {}
-
-                # This is a different case than no shared hashes. This happens when a remote
-                # doesn't return the hashes. Like rclone itself [1,2]. Ideally, we would
-                # have a settable fallback such as ModTime but this happens after listing
-                # and we don't want to have to list all ModTimes on the off chance of a
-                # fallback
-                #     [1] https://rclone.org/flags/
-                #         "-c, --checksum  Skip based on checksum (if available) & size,
-                #         not mod-time & size"
-                #     [2] https://forum.rclone.org/t/behavior-of-rclone-when-checksum-
-                #         but-checksum-is-missing-is-undocumented-and-unexpected/39231/3
-                #
-                if (not scheck or not dcheck) and not config.error_on_missing_hash:
-                    logger.warning(f"Missing hashes on source and/or dest")
-                    logger.warning(f"  src: {sfile['apath']!r}")
-                    logger.warning(f"  dst: {dfile['rpath']!r}")
-                    logger.warning(f"Reverting to 'size' only")
-
-                shared_hashes = set(scheck).intersection(set(dcheck))
-                if not shared_hashes and config.error_on_missing_hash:
-                    m = "Non compatible (or non existent) hashes. Change attributes"
-                    logger.info(m)
-                    msg.append(m)
-                    msg.append(f"source = {list(scheck)}, dest = {list(dcheck)}")
-                    raise NoCommonHashError(m)
-
-                for hashname in shared_hashes:
-                    if scheck[hashname] != dcheck[hashname]:
-                        msg.append(f"Checksum {hashname} does not match")
-                        return False
-
-            msg.append("MATCH")
-            return True
-        finally:
-            msg = " ".join(msg)
-            logger.debug(msg)
+    def _file_compare(self, sfile, dfile, attrib):
+        """Returns (match, reason). Cheapest checks first"""
+        s = sfile.get("size", "src_missing_size")
+        d = dfile.get("size", "dst_missing_size")
+        if s != d:
+            return False, f"Mismatch sizes. src: {s}, dst: {d}."
+
+        if attrib == "mtime":
+            s = sfile.get("mtime", "src_missing_mtime")
+            d = dfile.get("mtime", "dst_missing_mtime")
+            try:
+                c = abs(s - d) < self.config.dt
+            except TypeError:
+                c = False
+            if not c:
+                return False, f"Mismatch mtime. src: {s}, dst: {d}."
+
+        elif attrib == "hash":
+            config = self.config
+            scheck = sfile.get("checksum", {}) or {}  # Nones to empty dict
+            dcheck = dfile.get("checksum", {}) or {}
+
+            # This is a different case than no shared hashes. This happens when a remote
+            # doesn't return the hashes. Like rclone itself [1,2]. Ideally, we would
+            # have a settable fallback such as ModTime but this happens after listing
+            # and we don't want to have to list all ModTimes on the off chance of a
+            # fallback
+            #     [1] https://rclone.org/flags/
+            #         "-c, --checksum  Skip based on checksum (if available) & size,
+            #         not mod-time & size"
+            #     [2] https://forum.rclone.org/t/behavior-of-rclone-when-checksum-
+            #         but-checksum-is-missing-is-undocumented-and-unexpected/39231/3
+            #
+            if (not scheck or not dcheck) and not config.error_on_missing_hash:
+                logger.warning(f"Missing hashes on source and/or dest")
+                logger.warning(f"  src: {sfile['apath']!r}")
+                logger.warning(f"  dst: {dfile['rpath']!r}")
+                logger.warning(f"Reverting to 'size' only")
+
+            # Walk the (usually one) source hash directly rather than building an
+            # intersection. Every shared hash must match
+            shared = False
+            for hashname, shash in scheck.items():
+                if hashname not in dcheck:
+                    continue
+                if shash != dcheck[hashname]:
+                    return False, f"Checksum {hashname} does not match"
+                shared = True
+
+            if not shared and config.error_on_missing_hash:
+                m = "Non compatible (or non existent) hashes. Change attributes"
+                logger.info(m)
+                logger.debug(
+                    f"Compare {sfile['apath']!r} with {attrib = }. {m} "
+                    f"source = {list(scheck)}, dest = {list(dcheck)}"
+                )
+                raise NoCommonHashError(m)
+
+        return True, "MATCH"
 
     def track_moves(self):
         renames = self.config.renames
@@ -384,6 +639,10 @@ class Backup:
             logger.info("No new *and* deleted files. No rename tracking")
             return
 
+        if not renames and not dst_renames:
+            logger.info("Renames disabled. No rename tracking")
+            return
+
         # The algorithm for this is pretty simple. When a file is
         # renamed, it looks like the old file is deleted and the
         # new file is created. So the candidates are pretty simple.
@@ -391,39 +650,61 @@ class Backup:
         # Since size must *always* match, we make a dictionary by sizes
         # to reduce the pool
 
-        del_by_size = defaultdict(list)
+        src_files, dst_files = self.src_files, self.dst_files
+        min_rename_size = self.config.min_rename_size
+        file_compare = self.file_compare
+
+        # Resolve each deleted file's rename attribute once here rather than for every
+        # new file it is a candidate for. Files that can't be renamed are left out.
+        # Note that in the config dst_renames is already set to the correct values if
+        # it was None
+        #
+        # Many files can share a size so mtime candidates are further keyed by an
+        # mtime bucket twice the width of dt. A match (|smtime - dmtime| < dt) must
+        # then be in the new file's bucket or an adjacent one so the others never
+        # need to be compared. Everything else is keyed by size alone (None). The
+        # final say is still file_compare
+        dt = self.config.dt
+        width = 2 * dt if dt > 0 else 0  # dt <= 0 can never match on mtime
+        del_by_key = defaultdict(list)
         for apath in self.deleted:
-            dfile = self.dst_files[apath]
-            del_by_size[dfile["size"]].append(dfile)
+            dfile = dst_files[apath]
+            if not (attrib := dst_renames if dfile.get("dstinfo", 0) else renames):
+                continue
+            if attrib == "mtime":
+                if (bucket := _mtime_bucket(dfile, width)) is None:
+                    continue  # Would never match
+            else:
+                bucket = None
+            del_by_key[dfile["size"], bucket].append((dfile, attrib))
 
         for apath in self.new:
-            if os.path.basename(apath) == DFB_EMPTY:
+            if _is_empty_marker(apath):
                 continue
 
-            sfile = self.src_files[apath]
+            sfile = src_files[apath]
 
-            if (
-                self.config.min_rename_size
-                and sfile["size"] <= self.config.min_rename_size
-            ):
+            if min_rename_size and sfile["size"] <= min_rename_size:
                 logger.debug(
                     f"Skipped rename track on {sfile['apath']!r}. "
                     f"size = {sfile['size']} <= min_rename_size = "
-                    f"{self.config.min_rename_size}"
+                    f"{min_rename_size}"
                 )
                 continue
 
-            dfiles0 = del_by_size[sfile["size"]]  # list of candidate paths
-            dfiles = []
-            for dfile in dfiles0:
-                # Note that in the config dst_renames is already set to the correct
-                # values if it was None
-                attrib = dst_renames if dfile.get("dstinfo", 0) else renames
-                if not attrib:
-                    continue
-
-                if self.file_compare(sfile, dfile, attrib=attrib):
-                    dfiles.append(dfile)
+            # list of candidate paths. Use .get() so that a miss doesn't add an empty
+            # list for every new file's key
+            size = sfile["size"]
+            dfiles0 = del_by_key.get((size, None), [])
+            if (bucket := _mtime_bucket(sfile, width)) is not None:
+                for key in ((size, bucket - 1), (size, bucket), (size, bucket + 1)):
+                    if more := del_by_key.get(key):
+                        dfiles0 = dfiles0 + more
+            dfiles = [
+                dfile
+                for dfile, attrib in dfiles0
+                if file_compare(sfile, dfile, attrib=attrib)
+            ]
 
             if len(dfiles) == 1:
                 self.moves.append((dfiles[0], sfile))  # dfile,moved sfile
@@ -433,16 +714,29 @@ class Backup:
             else:
                 logger.info(f"Too many matches for {apath!r}. Not moving")
 
-        # Now we need to remove the moves from new and delete
-        undelete = set()
-        unnew = set()
-        for dfile, moved_sfile in self.moves:
-            undelete.add(dfile["apath"])
-            unnew.add(moved_sfile["apath"])
-
-        self.new[:] = list(set(self.new) - unnew)
+        # Now we need to remove the moves from new. Filter in place (rather than a set
+        # difference) so the listing order is kept and the logs are stable run-to-run.
+        unnew = frozenset(moved_sfile["apath"] for _, moved_sfile in self.moves)
+        self.new[:] = [apath for apath in self.new if apath not in unnew]
         # DO NOT UNDELETE!!! We still want them to be "deleted" with a delete marker
-        # NO: self.deleted[:] = list(set(self.deleted) - undelete)
+        # so self.deleted is left alone
+
+    def _recorded(self, worker):
+        """
+        Wrap a pipeline worker so that each success is also recorded in the dstdb from
+        the worker thread. Failures still return None.
+
+        The inserts are buffered so they are written in batches. The buffer is also
+        flushed on a short interval so that a completed file is still recorded
+        promptly. Must call self.dstdb.flush_buffered() when done.
+        """
+        insert = self.dstdb.insert_buffered
+
+        def _worker(file):
+            if file := worker(file):
+                return insert(file)
+
+        return _worker
 
     def transfer(self):
         config = self.config
@@ -453,13 +747,15 @@ class Backup:
 
         comb = self.new + self.modified
 
+        src_files = self.src_files
+
         N = len(comb)
-        totsize = sum(self.src_files[f]["size"] for f in comb)
+        totsize = sum(src_files[f]["size"] for f in comb)
 
-        def _apath2file(apath):
-            ts = self.config.now.ts
+        ts = config.now.ts  # Constant for the whole pipeline
 
-            file = self.src_files[apath].copy()
+        def _apath2file(apath):
+            file = src_files[apath].copy()
             file["rpath"] = rpath = apath2rpath(file["apath"], ts)
             file["timestamp"] = ts
             file["dstinfo"] = False  # Since this is coming from the source
@@ -472,15 +768,16 @@ class Backup:
             self.dump.extend(files)
             return
 
-        rc = self.config.rc
+        rc = config.rc
         rc.start()
+        src, dst, metadata = config.src, config.dst, config.metadata
 
         def _transfer(file):
             try:
-                sfile = self.config.src, file["apath"]
-                dfile = self.config.dst, file["rpath"]
+                sfile = src, file["apath"]
+                dfile = dst, file["rpath"]
 
-                if os.path.basename(file["apath"]) == DFB_EMPTY:
+                if _is_empty_marker(file["apath"]):
                     rc.write(dfile, b"")  # Empty file. mtime doesn't matter
                     logger.info(f"Uploading empty dir marker {file['rpath']!r}")
                     return file
@@ -488,7 +785,7 @@ class Backup:
                 msg = f"Uploading {file['apath']!r} to {file['rpath']!r}"
                 logger.info(msg)
 
-                meta = self.config.metadata
+                meta = metadata
                 if sfile[1].endswith(".rclonelink"):
                     meta = False
 
@@ -508,17 +805,15 @@ class Backup:
 
         stats = StatsThread(self.config, N, totsize, daemon=True).start()
 
-        files = tmap(_transfer, files, Nt=config.concurrency)
-        files = filter(bool, files)
-        # We could theoretically do an insert_many but that could lock the DB and/or
-        # require we accumulate. Instead, let it go right to insert which closes the DB
-        # each time. This is trivial compared to upload times. Plus, we want an upload
-        # to be recorded in the DB right away
-        files = map(self.dstdb.insert, files)
+        files = tmap(self._recorded(_transfer), files, Nt=config.concurrency)
 
         # Make them work
-        for file in files:
-            stats += 1
+        try:
+            for file in files:
+                if file:
+                    stats += 1
+        finally:
+            self.dstdb.flush_buffered()
 
         stats.join()
 
@@ -530,9 +825,9 @@ class Backup:
         moves = iter(self.moves)
 
         # Moves are already paired as original_dfile,moved_sfile
-        def _build_new_file(original_dfile, moved_sfile):
-            ts = self.config.now.ts
+        ts = config.now.ts  # Constant for the whole pipeline
 
+        def _build_new_file(original_dfile, moved_sfile):
             new = original_dfile.copy()
             new.update(moved_sfile)
 
@@ -550,42 +845,37 @@ class Backup:
             self.dump.extend(files)
             return
 
-        rc = self.config.rc
+        rc = config.rc
         rc.start()
+        dst = config.dst
 
         def _upload_ref(file):
             original = file["original"]
             ref_rpath = file["ref_rpath"]
             rpath = file["rpath"]
 
-            ref = {
-                "ver": 2,
-                "rel": os.path.relpath(rpath, os.path.dirname(ref_rpath)),
-            }
-            reftxt = json.dumps(ref)
+            rel = os.path.relpath(rpath, os.path.dirname(ref_rpath))
+            reftxt = _REF_TEMPLATE.format(json.dumps(rel))
             try:
                 logger.info(
                     f"Moving {original!r} to "
                     f"{file['apath']!r} with "
                     f"{ref_rpath!r}."
                 )
-                rc.write(
-                    (config.dst, ref_rpath),
-                    reftxt,
-                )
+                rc.write((dst, ref_rpath), reftxt)
                 return file
             except Exception as EE:
                 logger.error(f"Reference Error: {file['apath']!r}. {EE}")
                 with LOCK:
                     self.errcount += 1
 
-        files = tmap(_upload_ref, files, Nt=config.concurrency)
-        files = filter(bool, files)
-        files = map(self.dstdb.insert, files)
+        files = tmap(self._recorded(_upload_ref), files, Nt=config.concurrency)
 
         # Make them work
-        for file in files:
-            pass
+        try:
+            deque(files, maxlen=0)
+        finally:
+            self.dstdb.flush_buffered()
 
     def move_by_copy(self):
         config = self.config
@@ -594,9 +884,9 @@ class Backup:
         # to better enable concurrency.
         moves = iter(self.moves)
 
-        def _build_copiedfile(original_dfile, moved_sfile):
-            ts = self.config.now.ts
+        ts = config.now.ts  # Constant for the whole pipeline
 
+        def _build_copiedfile(original_dfile, moved_sfile):
             new = original_dfile.copy()
             new.update(moved_sfile)
 
@@ -614,15 +904,17 @@ class Backup:
             self.dump.extend(files)
             return
 
-        rc = self.config.rc
+        rc = config.rc
         rc.start()
 
+        dst, metadata = config.dst, config.metadata
+
         def _copy(file):
             try:
                 msg = f'"Moving" {file["original"]!r} to {file["apath"]!r} via copy'
 
-                sfile = rcpathjoin(self.config.dst, file["source_rpath"])
-                dfile = rcpathjoin(self.config.dst, file["rpath"])
+                sfile = dst, file["source_rpath"]
+                dfile = dst, file["rpath"]
 
                 logger.info(msg)
 
@@ -631,7 +923,7 @@ class Backup:
                     dst=dfile,
                     _config={
                         "NoCheckDest": True,
-                        "metadata": self.config.metadata,
+                        "metadata": metadata,
                     },
                 )
                 return file
@@ -640,13 +932,13 @@ class Backup:
                 with LOCK:
                     self.errcount += 1
 
-        files = tmap(_copy, files, Nt=config.concurrency)
-        files = filter(bool, files)
-        files = map(self.dstdb.insert, files)
+        files = tmap(self._recorded(_copy), files, Nt=config.concurrency)
 
         # Make them work
-        for file in files:
-            pass
+        try:
+            deque(files, maxlen=0)
+        finally:
+            self.dstdb.flush_buffered()
 
     def delete(self):
         config = self.config
@@ -656,10 +948,12 @@ class Backup:
         # to better enable concurrency.
         apaths = iter(self.deleted)
 
-        def _apath2file(apath):
-            ts = self.config.now.ts
+        ts = config.now.ts  # Constant for the whole pipeline
 
-            file = self.dst_files[apath].copy()
+        dst_files = self.dst_files
+
+        def _apath2file(apath):
+            file = dst_files[apath].copy()
             file["rpath"] = rpath = apath2rpath(file["apath"], ts, flag="D")
             file["timestamp"] = ts
             file["dstinfo"] = False  # Since this is coming from the source
@@ -672,65 +966,72 @@ class Backup:
             self.dump.extend(files)
             return
 
-        rc = self.config.rc
+        rc = config.rc
         rc.start()
+        dst = config.dst
 
         def _delete(file):
             dfile = file["rpath"]
             try:
                 logger.info(f"Deleting {file['apath']!r} with {dfile!r}.")
-                rc.write((config.dst, dfile), b"DEL")
+                rc.write((dst, dfile), b"DEL")
                 return file
             except Exception as EE:
                 logger.error(f"Delete Error: {file['apath']!r}. {EE}")
                 with LOCK:
                     self.errcount += 1
 
-        files = tmap(_delete, files, Nt=config.concurrency)
-        files = filter(bool, files)
-        files = map(self.dstdb.insert, files)
+        files = tmap(self._recorded(_delete), files, Nt=config.concurrency)
 
         # Make them work
-        for file in files:
-            pass
+        try:
+            deque(files, maxlen=0)
+        finally:
+            self.dstdb.flush_buffered()
 
     def action_summary(self):
         self.action_summary_text = []
 
-        _p = logger.debug
+        level = logging.DEBUG
         if self.config.cliconfig.dry_run or self.config.cliconfig.interactive:
-            _p = logger.info
-
-        m = f"New: {self.summary(self.new)}"
-        self.action_summary_text.append(m)
-        logger.info(m)
-        for file in self.new:
-            _p(f"   {file!r}")
-
-        m = f"Modified: {self.summary(self.modified)}"
-        self.action_summary_text.append(m)
-        logger.info(m)
-        for file in self.modified:
-            _p(f"   {file!r}")
-
-        m = f"Deleted: {self.summary(self.deleted,src=False)}"
-        self.action_summary_text.append(m)
-        logger.info(m)
-        for file in self.deleted:
-            _p(f"   {file!r}")
-
-        m = f"Moves: {self.summary([f[0]['apath'] for f in self.moves],src=False)}"
-        self.action_summary_text.append(m)
-        logger.info(m)
-        for file in self.moves:
-            _p(f"   {file[0]['apath']!r} --> {file[1]['apath']!r}")
-
-    def summary(self, files, src=True):
-        flist = self.src_files if src else self.dst_files
-        size = sum(flist[file]["size"] for file in files)
-        num, units = human_readable_bytes(size)
-        s = "s" if len(files) != 1 else ""
-        return f"{len(files)} file{s} ({num:0.2f} {units})"
+            level = logging.INFO
+        show = logger.isEnabledFor(level)
+
+        src_get, dst_get = self.src_files.__getitem__, self.dst_files.__getitem__
+        buckets = [
+            ("New", ((src_get(f)["size"], f) for f in self.new)),
+            ("Modified", ((src_get(f)["size"], f) for f in self.modified)),
+            ("Deleted", ((dst_get(f)["size"], f) for f in self.deleted)),
+            (
+                "Moves",
+                ((d["size"], (d["apath"], s["apath"])) for d, s in self.moves),
+            ),
+        ]
+
+        # One pass per bucket for both the size and (only if they will be shown) the
+        # paths. The paths are logged after the header so the order is unchanged
+        for name, items in buckets:
+            count = totsize = 0
+            paths = []
+            for size, path in items:
+                count += 1
+                totsize += size
+                if show:
+                    paths.append(path)
+
+            m = f"{name}: {self.summary(count, totsize)}"
+            self.action_summary_text.append(m)
+            logger.info(m)
+            for path in paths:
+                if isinstance(path, tuple):
+                    logger.log(level, f"   {path[0]!r} --> {path[1]!r}")
+                else:
+                    logger.log(level, f"   {path!r}")
+
+    def summary(self, count, totsize):
+        num, units = human_readable_bytes(totsize)
+        s = "s" if count != 1 else ""
+        return f"{count} file{s} ({num:0.2f} {units})"
 
     def run_stats(self):
         stats = []
@@ -742,22 +1043,17 @@ class Backup:
         )
 
         stats.append(f"Errors: {self.errcount}")
-        select = """
-            SUM(CASE 
-                WHEN (size >= 0 AND (isref IS NULL OR isref = 0) )
-                THEN size ELSE 0 END) 
-            AS totsize,
-            COUNT(size) as num
-            """
-        cur = self.dstdb.snapshot(select=select).fetchone()
+        cur = self.dstdb.snapshot(
+            select=_STATS_SELECT, groupselect=_STATS_GROUPSELECT, remove_delete=False
+        ).fetchone()
+
         num, units = human_readable_bytes(cur["totsize"])
         s = "s" if cur["num"] != 1 else ""
         stats.append(f"Current {cur['num']} file{s} ({num:0.2f} {units})")
 
-        tot = self.dstdb.db().execute(f"SELECT {select} FROM items").fetchone()
-        num, units = human_readable_bytes(tot["totsize"])
-        s = "s" if tot["num"] != 1 else ""
-        stats.append(f"Total {tot['num']} file{s} ({num:0.2f} {units})")
+        num, units = human_readable_bytes(cur["all_totsize"])
+        s = "s" if cur["all_num"] != 1 else ""
+        stats.append(f"Total {cur['all_num']} file{s} ({num:0.2f} {units})")
 
         stats.extend(self.action_summary_text)
         stats.append(f"Elapsed Time (approx): {time_format(time.time() - self.t0)}")
@@ -766,10 +1062,7 @@ class Backup:
     def call_shell(self, *, mode, stats=""):
         dry = self.config.cliconfig.dry_run
 
-        if mode == "pre":
-            cmds = self.config.pre_shell
-        elif mode == "post":
-            cmds = self.config.post_shell
+        cmds = {"pre": self.config.pre_shell, "post": self.config.post_shell}[mode]
 
         if not cmds:
             logger.debug(f"No cmds for {mode = }")
@@ -802,11 +1095,13 @@ class Backup:
             return
 
         # Need to copy the log file since it may change in the process of the upload
-        # from the calls itself
+        # from the calls itself. (So it can't be a hard link to the same file).
+        # copyfile (not copy2) since only the contents are needed and it lets the
+        # kernel do the copy where supported
         log_copy = config.logfile.with_stem("log_copy")
-        shutil.copy2(config.logfile, log_copy)
+        shutil.copyfile(config.logfile, log_copy)
 
-        for log_dest in log_dests:
+        def _upload(log_dest):
             dtxt = rcpathjoin(*listify(log_dest))
             logger.info(f"Uploading log to {dtxt!r}")
             try:
@@ -817,6 +1112,12 @@ class Backup:
             except Exception as e:
                 logger.error(f"Failed: {e}")
 
+        # The destinations are independent so upload to all of them at once
+        deque(
+            tmap(_upload, log_dests, Nt=min(config.concurrency, len(log_dests))),
+            maxlen=0,
+        )
+
 
 class StatsThread(Thread):
     def __init__(self, config, N, totsize, *args, **kwargs):
@@ -826,9 +1127,9 @@ class StatsThread(Thread):
         self.fcount = 0
 
         # Rather than a while loop with a time.sleep and a conditional,
-        # instead use a queue with a timeout. This means we can put something
-        # in the queue to kill it right away. (Can this use events instead?)
-        self.stop = queue.Queue()
+        # instead wait on an event with a timeout. This means we can set it
+        # to kill it right away.
+        self.stop = Event()
 
         super().__init__(*args, **kwargs)
 
@@ -837,8 +1138,10 @@ class StatsThread(Thread):
         return self
 
     def increment(self, n=1):
-        with LOCK:
-            self.fcount += n
+        # Only the thread consuming the transfer results increments this and run()
+        # just polls it once per interval so no lock is needed. A slightly stale
+        # read is fine for a progress stat.
+        self.fcount += n
         return self
 
     __iadd__ = increment  # += n
@@ -846,50 +1149,49 @@ class StatsThread(Thread):
     def run(self):
         inf = float("inf")
 
-        totnum, totunits = human_readable_bytes(self.totsize)
-
-        self.config.rc.call("core/stats-reset")
-        self.config.rc.call("core/stats")  # sets to 0
-        while True:
-            try:
-                stop = self.stop.get(block=True, timeout=self.config.stats)
-                if stop:
-                    break
-            except queue.Empty:
-                pass
-
-            stats = self.config.rc.call("core/stats")
+        N, totsize = self.N, self.totsize
+        totnum, totunits = human_readable_bytes(totsize)
+
+        rc, interval = self.config.rc, self.config.stats
+        rc.call("core/stats-reset")
+        rc.call("core/stats")  # sets to 0
+        while not self.stop.wait(interval):
+            stats = rc.call("core/stats")
+            get = stats.get
+            transferring = get("transferring", ())
+            nbytes = get("bytes", 0)
+            gspeed = get("speed", 0)
             msg = [f"STATS:"]
 
-            dt = time_format(stats.get("elapsedTime", inf))
+            dt = time_format(get("elapsedTime", inf))
             msg.append(f"{dt:5s};")
 
-            msg.append(f"xfer {len(stats.get('transferring',''))};")
+            msg.append(f"xfer {len(transferring)};")
 
-            bytesnum, bytesunits = human_readable_bytes(stats.get("bytes", 0))
+            bytesnum, bytesunits = human_readable_bytes(nbytes)
             msg.append(
-                f"{self.fcount}/{self.N} "  # stats['totalTransfers'] includes active so use self.fcount
+                f"{self.fcount}/{N} "  # stats['totalTransfers'] includes active so use self.fcount
                 f"({bytesnum:6.2f} {bytesunits} / {totnum:<6.2f} {totunits});"
             )
 
             # use these since they are weighted averages but need to account for each
             # transfer
-            speed = sum(i.get("speedAvg", 0) for i in stats.get("transferring", []))
+            speed = sum(i.get("speedAvg", 0) for i in transferring)
             # This is a heuristic approach. Prefer the weighted avg speed but
             # it can drop to zero. This doesn't have to be perfect.
-            rel = speed / (stats.get("speed", 0) + 1e-5 * (speed + 1))  # [0,inf)
-            frac = 2 / (1 + math.exp(-10 * rel)) - 1
-            sp = frac * speed + (1 - frac) * stats.get("speed", 0)
+            rel = speed / (gspeed + 1e-5 * (speed + 1))  # [0,inf)
+            frac = math.tanh(5 * rel)  # == 2 / (1 + exp(-10 * rel)) - 1
+            sp = frac * speed + (1 - frac) * gspeed
 
             speednum, speedunits = human_readable_bytes(sp)
             msg.append(f"{speednum:5.2f} {speedunits}/s;")
 
-            eta = round((self.totsize - stats.get("bytes", 0)) / sp)
+            eta = round((totsize - nbytes) / sp)
             msg.append(f"ETA: {time_format(eta)}")
 
             logger.info(" ".join(msg))
 
     def join(self, *a, **k):
-        self.stop.put(True)
+        self.stop.set()
         super().join(*a, **k)
         logger.debug("Joined stats thread")
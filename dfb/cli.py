@@ -50,6 +50,18 @@ def parse(argv=None, shebanged=False):
     if argv and argv[0] == "version":
         argv[0] = "--version"
 
+    parser = build_parser(shebanged=shebanged)
+    args = parser.parse_args(argv)
+    args._argv0 = argv
+
+    if getattr(args, "only", None):
+        args.before = args.after = args.only
+
+    return args
+
+
+def build_parser(shebanged=False):
+    """Build and return the top-level parser with all subcommands"""
     # config_global_group = global_parent.add_argument_group(title="Config Settings")
     config_global = argparse.ArgumentParser(add_help=False)
     config_global_group = config_global.add_argument_group(
@@ -861,13 +873,18 @@ def parse(argv=None, shebanged=False):
     #################################################
     ## DONE
     #################################################
-    args = parser.parse_args(argv)
-    args._argv0 = argv
 
-    if getattr(args, "only", None):
-        args.before = args.after = args.only
-
-    return args
+    # Each command's parser by its full command line (e.g. "advanced dbimport")
+    parser.commands = {}
+    for prefix, action in [
+        ("", subpar),
+        ("advanced ", adv_subpar),
+        ("utils ", cliutil_subpar),
+    ]:
+        for name, cmdparser in action.choices.items():
+            parser.commands[prefix + name] = cmdparser
+
+    return parser
 
 
 def clishebang(argv=None):
@@ -260,10 +260,15 @@ class Config:
         from .rclonecli import RcloneCLI
         from .rclonerc import RC
 
+        # Let rclone run as many transfers as we send it concurrently unless the user
+        # already set it
+        serve_flags = self.rclone_flags + ["-vv"]  # always verbose but filter later
+        if not any(str(f).split("=")[0] == "--transfers" for f in serve_flags):
+            serve_flags.append(f"--transfers={self.concurrency}")
+
         self.rc = RC(
             rclone_exe=self.rclone_exe,
-            serve_flags=self.rclone_flags
-            + ["-vv"],  # always include verbose but filter later
+            serve_flags=serve_flags,
             rclone_env=self.rclone_env,
         )
 
@@ -12,6 +12,18 @@ import logging
 import string
 import shutil
 import gzip as gz
+
+SNAPSHOT_GZ_LEVEL = 9  # gzip's best (and default)
+try:  # Optional. Much faster compression and still writes plain gzip
+    from isal import igzip as gz
+
+    # ISA-L's levels are only 0-3 (default 2). Its best is used but snapshots will
+    # still be somewhat larger than gzip's 9 for a several times faster compression
+    SNAPSHOT_GZ_LEVEL = 3
+except ImportError:
+    pass
+
+from threading import Thread, Lock, Event
 from functools import partialmethod
 from textwrap import dedent, indent
 
@@ -77,6 +89,12 @@ class DFBDST:
 
         self.dbpath = dbpath
 
+        # For insert_buffered
+        self._buffer = []
+        self._buffer_lock = Lock()
+        self._flush_lock = Lock()
+        self._flusher = None
+
         self.init()
 
     def db(self):
@@ -86,8 +104,8 @@ class DFBDST:
         return db
 
     def init(self):
-        # We will only write to the DB in the main thread but will
-        # read in many
+        # Writes come from the main thread and, through insert_buffered, the
+        # pipeline workers and background flusher. Every call gets its own connection
         items = ",".join((" ".join(row)) for row in self.COLS)
         db = self.db()
 
@@ -516,20 +534,23 @@ class DFBDST:
 
         # Collect them all. We will do it anyway in the DB and this way it can be yielded
         files = list(files)
-        # Insert into DB in the main thread
+        # May be called from worker threads (buffered inserts) so each call uses its
+        # own connection
         rows = map(DFBDST.dict2fullrow, files)
         # ALWAYS wait before an executemany since that could lock the DB
         rows = list(rows)
 
+        # One transaction (and one commit) for the whole batch
         db = self.db()
-        with db:
-            db.executemany(sql, rows)
-        # db.commit()
-        # db.close()
+        try:
+            with db:
+                db.executemany(sql, rows)
+        finally:
+            db.close()
 
+        # Written together and flushed once when closed
         with self.snap_file.open(mode="at") as fp:
-            for file in files:
-                print(json.dumps(file), file=fp, flush=True)
+            fp.writelines(f"{json.dumps(file)}\n" for file in files)
 
         return files
 
@@ -554,6 +575,72 @@ class DFBDST:
     replace = partialmethod(_insert_or_replace, insert=False, replace=True)
     insert_or_replace = partialmethod(_insert_or_replace, insert=True, replace=True)
 
+    def insert_buffered(self, file, *, flush_every=500, flush_interval=1.0):
+        """
+        Like insert but buffers the files and writes them in batches with insert_many.
+        A background thread also flushes every flush_interval seconds so that
+        completed files are still recorded promptly when they come in slowly.
+
+        Each batch is one transaction so an interruption loses at most the files that
+        completed since the last flush (at most flush_every or flush_interval seconds
+        worth). Those are then just uploaded again on the next run.
+
+        MUST call flush_buffered() when done (including on errors). Returns file.
+        """
+        with self._buffer_lock:
+            self._buffer.append(file)
+            n = len(self._buffer)
+
+            if self._flusher is None:
+                stop = Event()
+
+                def _flusher():
+                    while not stop.wait(flush_interval):
+                        try:
+                            self._flush_buffer()
+                        except Exception as EE:
+                            # The files are back in the buffer. Leave them for the
+                            # next flush, which will raise again if this wasn't
+                            # transient
+                            logger.error(f"Background DB flush failed: {EE!r}")
+                            return
+
+                self._flusher = Thread(target=_flusher, daemon=True)
+                self._flusher.stop = stop
+                self._flusher.start()
+
+        if n >= flush_every:
+            self._flush_buffer()
+        return file
+
+    def flush_buffered(self):
+        """
+        Write any remaining buffered files and stop the background flusher. This
+        includes any whose earlier flush failed. Raises if the write fails
+        """
+        with self._buffer_lock:
+            flusher, self._flusher = self._flusher, None
+        if flusher:
+            flusher.stop.set()
+            flusher.join()
+        self._flush_buffer()
+
+    def _flush_buffer(self):
+        # The flush lock makes sure the DB and snapshot writes from the main thread and
+        # the background flusher do not interleave
+        with self._flush_lock:
+            with self._buffer_lock:
+                files, self._buffer = self._buffer, []
+            if not files:
+                return
+            try:
+                self.insert_many(files)
+            except:
+                # Put them back (in order) so they aren't lost before re-raising
+                with self._buffer_lock:
+                    self._buffer[:0] = files
+                raise
+
     def _snapshot_query_builder(
         self,
         *,
@@ -982,8 +1069,9 @@ class DFBDST:
                 snap_file.unlink()
             elif compress:
                 snapz = snap_file.with_suffix(".jsonl.gz")
-                with gz.open(str(snapz), "wb") as fz, snap_file.open("rb") as fu:
-                    shutil.copyfileobj(fu, fz)
+                fz = gz.open(str(snapz), "wb", compresslevel=SNAPSHOT_GZ_LEVEL)
+                with fz, snap_file.open("rb") as fu:
+                    shutil.copyfileobj(fu, fz, 1 << 20)
                 snap_file.unlink()
                 logger.debug(f"Compressed {str(snap_file)!r} to {str(snapz)!r}")
 
@@ -36,6 +36,11 @@ import time
 import logging
 from functools import partialmethod, cached_property, partial
 
+try:  # Optional. Faster parsing of very long listings but not required
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
 from .timestamps import timestamp_parser
 from . import __version__
 
@@ -239,7 +244,7 @@ class RcloneCLI:
 
         cmd = ["lsjson", RcloneCLI.pathjoin(self.remote, subdir), "--recursive"]
         if fast_list == "auto":
-            fast_list = rclone.features.get("ListR", False)
+            fast_list = self.features.get("ListR", False)
         if fast_list:
             cmd.append("--fast-list")
 
@@ -270,10 +275,9 @@ class RcloneCLI:
 
         cmd += _flagify(flags)
 
-        # Long directories can be problematic so use a tempfile so as to not exhaust the
-        # buffer. We also want to parse this lazily since it could be long. This isn't
-        # perfect since we wait for the entire listing to finish then read line by line
-        # but it avoids accidentally deadlocking.
+        # The listing could be long so it is parsed lazily, one entry per line, as
+        # rclone writes it. popen_streamer reads stdout and stderr on their own threads
+        # so a full pipe can't deadlock.
         res = self.call(cmd, pipe=pipe, stream=True, **_dictify(callopts))
 
         # Special case for '--stat' whether user specified or from iteminfo.
@@ -288,26 +292,32 @@ class RcloneCLI:
             item = json.loads(b"".join(lines))
             res = [("stdout", json.dumps(item).encode())]
 
-        for oe, line in res:
-            if oe != "stdout":
-                logger.debug(f"stdout: {line}")
-                continue
+        try:
+            for oe, line in res:
+                if oe != "stdout":
+                    logger.debug(f"stdout: {line}")
+                    continue
 
-            # lsjson returns one entry per line. And always UTF8
-            line = line.decode("utf8")
-            line = line.strip().rstrip(",").strip()
+                # lsjson returns one entry per line. And always UTF8 so json.loads can
+                # take the bytes directly without decoding them first
+                line = line.strip().rstrip(b",").strip()
 
-            if line == "[" or line == "]":  # start or end line
-                continue
+                if line == b"[" or line == b"]":  # start or end line
+                    continue
 
-            line = json.loads(line)
+                line = _json_loads(line)
 
-            # Never understood why rclone gives us this...
-            line.pop("Name", None)
+                # Never understood why rclone gives us this...
+                line.pop("Name", None)
 
-            if "ModTime" in line:  # Do regardless of modtime setting
-                line["ModTime"] = timestamp_parser(line["ModTime"], epoch=epoch_time)
-            yield line
+                if "ModTime" in line:  # Do regardless of modtime setting
+                    line["ModTime"] = timestamp_parser(
+                        line["ModTime"], epoch=epoch_time
+                    )
+                yield line
+        finally:
+            if close := getattr(res, "close", None):
+                close()  # Stops rclone if this is closed early
 
     ls = listremote
 
@@ -1078,14 +1088,23 @@ def popen_streamer(proc, allow_error=False):
     outthread.start(), errthread.start()
 
     c = 0
-    while c < 2:
-        oe, line = Q.get()
-        if line is None:
-            c += 1
+    try:
+        while c < 2:
+            oe, line = Q.get()
+            if line is None:
+                c += 1
+                Q.task_done()
+                continue
+            yield oe, line
             Q.task_done()
-            continue
-        yield oe, line
-        Q.task_done()
+    except GeneratorExit:
+        # Closed before the output was done. Stop the process so the readers hit EOF
+        # rather than leaving it running to completion in the background
+        proc.kill()
+        proc.wait()
+        outthread.join()
+        errthread.join()
+        raise
 
     proc.wait()  # Should be done executing already
     if not allow_error:
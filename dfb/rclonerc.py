@@ -15,7 +15,7 @@ import atexit
 import logging
 from collections import defaultdict
 from functools import partialmethod, cache
-from threading import Thread
+from threading import Thread, local
 from queue import Queue
 
 from .utils import randstr, dictify, listify
@@ -87,6 +87,9 @@ class RC:
         self._started = False
         self._exit = False
 
+        # One keep-alive session per thread (requests.Session is not thread-safe)
+        self._local = local()
+
     def __enter__(self):
         self.start()
         return self
@@ -186,8 +189,17 @@ class RC:
                 self.proc.send_signal(signal.SIGKILL)
             except:
                 pass
+        self._local = local()  # Drop the pooled connections to the old server
         return self
 
+    def _session(self):
+        try:
+            return self._local.session
+        except AttributeError:
+            session = self._local.session = requests.Session()
+            session.auth = HTTPBasicAuth(self.user, self.password)
+            return session
+
     def _cpmvfile(self, *, cpmv, src, dst, use_async=False, **params):
         """
         src and dst can either be strings or (Fs,Remote) tuples. The latter will
@@ -607,11 +619,8 @@ class RC:
             + urllib.parse.urlencode(params)
         )
 
-        resp = requests.post(
-            url,
-            auth=HTTPBasicAuth(self.user, self.password),
-            **postkw,
-        )
+        # Reuse the connection rather than a new TCP handshake for every call
+        resp = self._session().post(url, **postkw)
         res = resp.json()
 
         # This is developer-level debug. Comment out for now
@@ -6,6 +6,7 @@ import os, sys
 import subprocess
 import shlex
 import logging
+from functools import partial
 
 from . import LOCK
 from .dstdb import DFBDST
@@ -16,6 +17,14 @@ from .threadmapper import thread_map_unordered as tmap
 logger = logging.getLogger(__name__)
 
 
+def _write_lines(fp, lines):
+    """Write the lines joined by newlines without building the whole string"""
+    for line in lines:
+        fp.write(line)
+        break
+    fp.writelines(f"\n{line}" for line in lines)
+
+
 class SourceNotFoundError(ValueError):
     pass
 
@@ -121,26 +130,31 @@ class Restore:
             _p(f"    {s!r} --> {d!r} ({num:0.2f} {units})")
 
     def transfer_shell(self):
+        # Lines are written as they are built rather than collected and joined
+        lines = self._shell_lines()
+        if self.args.shell_script == "-":
+            _write_lines(sys.stdout, lines)
+            print(flush=True)
+        else:
+            with open(self.args.shell_script, "wt") as fp:
+                _write_lines(fp, lines)
+            logger.info(f"Shell script written to {self.args.shell_script!r}")
+
+    def _shell_lines(self):
         config = self.config
-        out = [shell_header(config, cd=True)]
+        yield shell_header(config, cd=True)
 
-        cmd = [config.rclone_exe] + config.rclone_flags
+        # The command prefix is the same for every line so only quote it once
+        cmd = shlex.join([config.rclone_exe] + config.rclone_flags)
+        dst_join = partial(rcpathjoin, config.dst)
+        quote = shlex.quote
         for src, dst, _ in self.transfers:
-            src = rcpathjoin(self.config.dst, src)
+            src = quote(dst_join(src))
             if dst == "-":
-                nc = cmd + ["cat", rcpathjoin(self.config.dst, src)]
-                out.append(shlex.join(nc))
+                yield f"{cmd} cat {src}"
                 continue
-            dst = rcpathjoin(*listify(dst))
-            nc = cmd + ["copyto", src, dst]
-            out.append(shlex.join(nc))
-
-        if self.args.shell_script == "-":
-            print("\n".join(out), flush=True)
-        else:
-            with open(self.args.shell_script, "wt") as fp:
-                fp.write("\n".join(out))
-            logger.info(f"Shell script written to {self.args.shell_script!r}")
+            dst = quote(rcpathjoin(*listify(dst)))
+            yield f"{cmd} copyto {src} {dst}"
 
     def transfer(self):
         config = self.config
@@ -6,12 +6,28 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-# This will get monkey-patched later when used in dfb but it is done like this so that
-# this module code can be copied to other projects w/o this being affected
 def nowfun():
     return datetime.datetime.now().astimezone(datetime.timezone.utc)
 
 
+def _get_nowfun():
+    """
+    Use dfb's nowfun (which can be overridden for testing) when this is part of dfb.
+    It is looked up on first use rather than patched in on import so that this
+    module code can be copied to other projects w/o this being affected
+    """
+    global _nowfun
+    if _nowfun is None:
+        try:
+            from . import nowfun_obj as _nowfun
+        except ImportError:
+            _nowfun = nowfun
+    return _nowfun
+
+
+_nowfun = None
+
+
 def timestamp_parser(timestamp, aware=False, utc=False, epoch=False, now=None):
     """
     Will either accept iso8601 and pass aware,utc, and epoc
@@ -43,7 +59,7 @@ def timestamp_parser(timestamp, aware=False, utc=False, epoch=False, now=None):
     """
     delta = timedelta_parser(timestamp)
     if delta:
-        now = now or nowfun()
+        now = now or _get_nowfun()()
         timestamp = timestamp_parser(now, aware=aware, utc=utc) - delta
 
     return iso8601_parser(timestamp, aware=aware, utc=utc, epoch=epoch)
@@ -12,6 +12,7 @@ import mimetypes
 import re
 import logging
 from collections import namedtuple
+from functools import lru_cache
 
 from .timestamps import timestamp_parser, iso8601_parser
 
@@ -102,6 +103,19 @@ def tabulate(table, indent=2, sep="  "):
     return "\n".join(tabulated)
 
 
+_BYTES_LABELS = {
+    (1000, True): ("B", "kB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB"),
+    (1000, False): tuple(
+        l + "byte"
+        for l in ("", "kilo", "mega", "giga", "tera", "peta", "exa", "zetta", "yotta")
+    ),
+    (1024, True): ("B", "KiB", "MiB", "GiB", "TiB", "PiB", "EiB", "ZiB", "YiB"),
+    (1024, False): tuple(
+        l + "bibyte" for l in ("", "ki", "me", "gi", "te", "pe", "ex", "ze", "yo")
+    ),
+}
+
+
 def human_readable_bytes(
     byte_count,
     base=int(os.environ.get("DFB_BASE", 1024)),  # undocumented environment setting
@@ -129,24 +143,13 @@ def human_readable_bytes(
     if base not in (1024, 1000):
         raise ValueError("base must be 1000 or 1024")
 
+    # Largest power (up to 8) where byte_count / base**best >= 1. The labels are
+    # built once at import
     best = 0
-    for ii in range(9):
-        if (byte_count / (base**ii * 1.0)) < 1:
-            break
-        best = ii
-
-    if base == 1000 and short:
-        labels = ["B", "kB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB"]
-    elif base == 1000 and not short:
-        labels = ["", "kilo", "mega", "giga", "tera", "peta", "exa", "zetta", "yotta"]
-        labels = [l + "byte" for l in labels]
-    elif base == 1024 and short:
-        labels = ["B", "KiB", "MiB", "GiB", "TiB", "PiB", "EiB", "ZiB", "YiB"]
-    elif base == 1024 and not short:
-        labels = ["", "ki", "me", "gi", "te", "pe", "ex", "ze", "yo"]
-        labels = [l + "bibyte" for l in labels]
-
-    res = byte_count / (base**best * 1.0), labels[best]
+    while best < 8 and byte_count >= base ** (best + 1):
+        best += 1
+
+    res = byte_count / (base**best * 1.0), _BYTES_LABELS[base, short][best]
     if fmt:
         return "{0:g} {1:s}".format(*res)
     return res
@@ -513,6 +516,15 @@ def parse_dateflag(ts):
     return ts, flag
 
 
+@lru_cache(maxsize=128)
+def _int2tsdt(ts):
+    """
+    time2all(ts)[:2] for integer timestamps. All files in a backup share the same
+    one so this is nearly always a cache hit
+    """
+    return time2all(ts)[:2]
+
+
 def apath2rpath(apath, ts=None, *, flag="", verify=True):
     """
     Convert from apath,ts ('sub/dir/file.txt',12345)
@@ -524,7 +536,10 @@ def apath2rpath(apath, ts=None, *, flag="", verify=True):
     from . import nowfun  # Avoid circular import
 
     ts = ts or nowfun()[0]
-    ts, dt, _, _ = time2all(ts)
+    if isinstance(ts, int):
+        ts, dt = _int2tsdt(ts)
+    else:
+        ts, dt, _, _ = time2all(ts)
 
     base, ext = smart_splitext(apath)
     rpath = f"{base}.{dt}{flag}{ext}"
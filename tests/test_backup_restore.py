@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os, sys, shutil
+import time
 from pathlib import Path
 import gzip as gz
 import lzma as xz
@@ -9,6 +10,8 @@ import re
 import subprocess
 import json
 import itertools
+import threading
+import sqlite3
 import shlex
 from textwrap import dedent
 
@@ -1138,6 +1141,132 @@ def test_missing_hashes():
         _FAIL.remove("missing_hashes")
 
 
+def test_local_hashes():
+    """
+    When rclone doesn't give hashes for a local source, they are computed locally.
+    More files than the hashing pool buffers and only some need hashing
+    """
+    test = testutils.Tester(name="local_hashes")
+    test.config["compare"] = "hash"
+    test.write_config()
+
+    N = 60
+    for ii in range(N):
+        test.write_pre(f"src/file{ii:03d}.txt", "version 1")
+    test.backup(offset=1)
+
+    for ii in range(0, N, 3):
+        test.write_post(f"src/file{ii:03d}.txt", "version 2")  # Same size!
+
+    try:
+        from dfb import _FAIL
+
+        _FAIL.add("no_rclone_hashes")
+        test.backup(offset=3)
+    finally:
+        _FAIL.remove("no_rclone_hashes")
+
+    log, debug = test.logs[-1]
+    assert debug.count("Computing hashes locally") == N
+    assert "Missing hashes" not in log
+
+    # The changes were found by hash (sizes are all the same)
+    changed = {f"file{ii:03d}.19700101000003.txt" for ii in range(0, N, 3)}
+    assert {p for p in os.listdir("dst") if "19700101000003" in p} == changed
+
+
+def _assert_no_stuck_threads():
+    # Nothing may be left behind that would keep the process from exiting
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        stuck = [t for t in threading.enumerate() if t.is_alive() and not t.daemon]
+        if stuck == [threading.main_thread()]:
+            break
+        time.sleep(0.05)
+    assert stuck == [threading.main_thread()], stuck
+
+
+def test_local_hashes_listing_error():
+    """A failed listing while hashing locally has to raise, not hang"""
+    test = testutils.Tester(name="local_hashes_listing_error")
+    test.config["compare"] = "hash"
+    test.write_config()
+
+    for ii in range(20):
+        test.write_pre(f"src/file{ii:03d}.txt", "version 1")
+    test.backup(offset=1)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        test.backup("-v", "--subdir", "doesnotexist", offset=3)
+
+    _assert_no_stuck_threads()
+
+
+@pytest.mark.parametrize("refresh", [False, True])
+def test_duplicate_source_paths(refresh):
+    """Some remotes list the same path twice. The first one is used either way"""
+    from dfb.backup import Backup
+
+    test = testutils.Tester(name="duplicate_source_paths")
+    test.write_config()
+
+    test.write_pre("src/other.txt", "other")
+    test.backup(offset=1)
+
+    test.write_post("src/dup.txt", "dup")
+
+    list_src_iter = Backup.list_src_iter
+
+    def _list_src_iter(self, *args, **kwargs):
+        for file in list_src_iter(self, *args, **kwargs):
+            yield file
+            if file["apath"] == "dup.txt":
+                yield file | {"size": 12345}
+
+    Backup.list_src_iter = _list_src_iter
+    try:
+        test.backup(*(["--refresh"] if refresh else []), offset=3)
+    finally:
+        Backup.list_src_iter = list_src_iter
+
+    with test.dstdb.db() as db:
+        rows = db.execute("SELECT * FROM items WHERE apath = 'dup.txt'").fetchall()
+    assert len(rows) == 1
+    assert rows[0]["size"] == 3
+
+
+def test_missing_hashes_many_files():
+    """
+    Same as the error at the end of test_missing_hashes but with more files than the
+    listing pipeline's queues can buffer. The compare fails while the source is still
+    being listed and that listing must still shut down
+    """
+    test = testutils.Tester(name="missing_hashes_many")
+    test.config["compare"] = "hash"
+    test.config["error_on_missing_hash"] = True
+    test.write_config()
+
+    N = 300
+    for ii in range(N):
+        test.write_pre(f"src/file{ii:03d}.txt", "version 1")
+    test.backup(offset=1)
+
+    for ii in range(N):
+        test.write_post(f"src/file{ii:03d}.txt", "version 2")  # Same size!
+
+    try:
+        from dfb import _FAIL
+
+        _FAIL.add("missing_hashes")
+
+        with pytest.raises(NoCommonHashError):
+            test.backup("-v", offset=3)  # '-v' to raise the error
+    finally:
+        _FAIL.remove("missing_hashes")
+
+    _assert_no_stuck_threads()
+
+
 @pytest.mark.parametrize("metadata", [True, False])
 def test_metadata(metadata):
     test = testutils.Tester(name="metadata")
@@ -1432,6 +1561,90 @@ def test_refresh_no_snapshots():
     assert "Unable to load snapshots from remote" in log
 
 
+def test_insert_buffered():
+    test = testutils.Tester(name="insert_buffered")
+    test.write_config()
+    dstdb = test.dstdb
+
+    def _count():
+        with dstdb.db() as db:
+            return db.execute("SELECT COUNT(*) AS c FROM items").fetchone()["c"]
+
+    files = [
+        {"rpath": f"file{i}.19700101000001.txt", "apath": f"file{i}.txt"}
+        | {"timestamp": 1, "size": i, "isref": 0, "dstinfo": 0}
+        for i in range(5)
+    ]
+
+    # Flushes once the buffer is full
+    for file in files[:3]:
+        assert dstdb.insert_buffered(file, flush_every=3, flush_interval=100) is file
+    assert _count() == 3
+
+    # Otherwise waits for the interval or the final flush
+    dstdb.insert_buffered(files[3], flush_every=3, flush_interval=100)
+    assert _count() == 3
+    dstdb.flush_buffered()
+    assert _count() == 4
+
+    dstdb.insert_buffered(files[4], flush_every=3, flush_interval=0.01)
+    deadline = time.time() + 10
+    while _count() < 5 and time.time() < deadline:
+        time.sleep(0.01)
+    assert _count() == 5
+    dstdb.flush_buffered()
+
+    snaps = [json.loads(line) for line in dstdb.snap_file.read_text().splitlines()]
+    assert sorted(snap["apath"] for snap in snaps) == [f["apath"] for f in files]
+
+
+def test_insert_buffered_errors():
+    test = testutils.Tester(name="insert_buffered_errors")
+    test.write_config()
+    dstdb = test.dstdb
+
+    def _count():
+        with dstdb.db() as db:
+            return db.execute("SELECT COUNT(*) AS c FROM items").fetchone()["c"]
+
+    files = [
+        {"rpath": f"file{i}.19700101000001.txt", "apath": f"file{i}.txt"}
+        | {"timestamp": 1, "size": i, "isref": 0, "dstinfo": 0}
+        for i in range(3)
+    ]
+
+    insert_many = dstdb.insert_many
+    fails = []
+
+    def _insert_many(files):
+        if fails:
+            fails.pop()
+            raise sqlite3.OperationalError("database is locked")
+        return insert_many(files)
+
+    dstdb.insert_many = _insert_many
+
+    # A failed background flush keeps the files for the final flush
+    fails.append(True)
+    for file in files:
+        dstdb.insert_buffered(file, flush_every=100, flush_interval=0.01)
+    deadline = time.time() + 10
+    while fails and time.time() < deadline:
+        time.sleep(0.01)
+    assert not fails  # It was tried
+    dstdb.flush_buffered()
+    assert _count() == 3
+
+    # And if it keeps failing, the final flush raises rather than dropping them
+    file = files[0] | {"timestamp": 2, "rpath": "file0.19700101000002.txt"}
+    dstdb.insert_buffered(file, flush_every=100, flush_interval=100)
+    fails.append(True)
+    with pytest.raises(sqlite3.OperationalError):
+        dstdb.flush_buffered()
+    dstdb.flush_buffered()  # Still buffered
+    assert _count() == 4
+
+
 if __name__ == "__main__":
     test_main("reference")
     #     test_main("copy")
@@ -1460,6 +1673,7 @@ if __name__ == "__main__":
     #     test_push_snapshots()
     #     test_empty_dirs()
     #     test_refresh_no_snapshots()
+    #     test_insert_buffered()
     print("=" * 50)
     print(" All Passed ".center(50, "="))
     print("=" * 50)
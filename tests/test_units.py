@@ -3,13 +3,20 @@ Unit-like tests
 """
 
 import os, sys, time
+import json
+import hashlib
+import tempfile
 
 p = os.path.abspath("../")
 if p not in sys.path:
     sys.path.insert(0, p)
 
+import dfb
 from dfb.utils import smart_splitext, time2all, head_tail_table, parse_bytes
+from dfb.utils import human_readable_bytes
 from dfb.dstdb import rpath2apath, apath2rpath
+from dfb.backup import _local_hash, _is_empty_marker, DFB_EMPTY, _REF_TEMPLATE
+from dfb.backup import _mtime_bucket
 
 DATED_SPLIT_TESTS = {
     # Older style names before smart-split then test with smart
@@ -405,6 +412,107 @@ def test_parse_bytes():
         assert parse_bytes(inval) == gold
 
 
+def test_nowfun_override():
+    old = dfb._override_ts, dfb._override_unix, dfb._override_offset
+    try:
+        dfb._override_ts, dfb._override_unix, dfb._override_offset = None, None, 0
+        dfb._refresh_nowfun()
+        assert abs(dfb.nowfun().ts - time.time()) < 5
+
+        dfb._override_ts = "1970-01-01 00:00:00Z"
+        dfb._override_offset = 10
+        dfb._refresh_nowfun()
+        assert dfb.nowfun().ts == 10
+    finally:
+        dfb._override_ts, dfb._override_unix, dfb._override_offset = old
+        dfb._refresh_nowfun()
+
+
+def test_local_hash():
+    data = os.urandom(1024 * 1024 + 17)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "file")
+        with open(path, "wb") as fp:
+            fp.write(data)
+
+        for htype in ["md5", "sha1", "sha256"]:
+            gold = hashlib.new(htype, data).hexdigest()
+            assert _local_hash(path, htype) == gold
+            assert _local_hash(path, htype, bufsize=1000) == gold
+
+
+def test_is_empty_marker():
+    for apath in [
+        DFB_EMPTY,
+        f"sub/{DFB_EMPTY}",
+        f"sub/dir/{DFB_EMPTY}",
+        f"sub/not{DFB_EMPTY}",
+        f"{DFB_EMPTY}/file",
+        f"sub/{DFB_EMPTY}.txt",
+        "file.txt",
+    ]:
+        assert _is_empty_marker(apath) == (os.path.basename(apath) == DFB_EMPTY)
+
+
+def test_ref_template():
+    for rel in ["file.txt", "../sub/file.19700101000000.txt", 'we"ird\\ünicode']:
+        reftxt = _REF_TEMPLATE.format(json.dumps(rel))
+        assert reftxt == json.dumps({"ver": 2, "rel": rel})
+        assert json.loads(reftxt) == {"ver": 2, "rel": rel}
+
+
+def test_human_readable_bytes():
+    assert human_readable_bytes(0, 1024) == (0.0, "B")
+    assert human_readable_bytes(1023, 1024) == (1023.0, "B")
+    assert human_readable_bytes(1024, 1024) == (1.0, "KiB")
+    assert human_readable_bytes(1536, 1024, fmt=True) == "1.5 KiB"
+    assert human_readable_bytes(2.5 * 1000**3, 1000) == (2.5, "GB")
+    assert human_readable_bytes(1000**2, 1000, short=False) == (1.0, "megabyte")
+    assert human_readable_bytes(1024**9, 1024) == (1024.0, "YiB")  # Capped
+
+
+def test_mtime_bucket():
+    import random
+
+    assert _mtime_bucket({}, 2.0) is None
+    assert _mtime_bucket({"mtime": None}, 2.0) is None
+    assert _mtime_bucket({"mtime": 10.0}, 0) is None
+
+    # Anything within dt must be in the same or an adjacent bucket of width 2*dt
+    for dt in [1.0, 0.001, 3.3]:
+        for _ in range(10000):
+            a = random.uniform(0, 2e9)
+            b = a + random.uniform(-dt, dt) * 0.999999
+            if abs(a - b) >= dt:
+                continue
+            ba = _mtime_bucket({"mtime": a}, 2 * dt)
+            bb = _mtime_bucket({"mtime": b}, 2 * dt)
+            assert abs(ba - bb) <= 1
+
+
+def test_snapshot_gzip():
+    import gzip
+    from dfb import dstdb
+
+    try:
+        from isal import igzip
+    except ImportError:
+        assert dstdb.gz is gzip
+        assert dstdb.SNAPSHOT_GZ_LEVEL == 9
+    else:
+        assert dstdb.gz is igzip
+        assert dstdb.SNAPSHOT_GZ_LEVEL == 3
+
+    # Whichever is used has to write plain gzip at that level
+    data = b"".join(f'{{"apath": "file{i}.txt"}}\n'.encode() for i in range(1000))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "snap.jsonl.gz")
+        with dstdb.gz.open(path, "wb", compresslevel=dstdb.SNAPSHOT_GZ_LEVEL) as fz:
+            fz.write(data)
+        with gzip.open(path, "rb") as fp:
+            assert fp.read() == data
+
+
 if __name__ == "__main__":
     # Names and split
     test_smart_splitext()
@@ -415,6 +523,13 @@ if __name__ == "__main__":
     test_time2all()
     test_head_tail_table()
     test_parse_bytes()
+    test_human_readable_bytes()
+    test_nowfun_override()
+    test_local_hash()
+    test_is_empty_marker()
+    test_ref_template()
+    test_mtime_bucket()
+    test_snapshot_gzip()
 
     print("=" * 50)
     print(" All Passed ".center(50, "="))
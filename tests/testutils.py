@@ -88,6 +88,7 @@ class Tester:
 
         dfb.configuration._TEMPDIR = "TEMP"
         dfb._override_ts = "1970-01-01 00:00:00Z"  # Offsets = unix time
+        dfb._refresh_nowfun()
 
         self.pwd = Path(os.path.abspath(f"testdirs/{name}"))
         self.make_ignore()
@@ -143,6 +144,7 @@ class Tester:
         if offset is None:
             offset = 2 * len(self.logs) + 1
         dfb._override_offset = offset
+        dfb._refresh_nowfun()
 
         r = dfb.cli.cli([cmd0, *args, "--config", self.configfile])
 